@@ -260,6 +260,11 @@ class EncodedContentFiles(sqlutil.Database):
     This excludes the EOF markers which are appended to each encoded text.
     """
     with self.Session() as session:
+      # Written by SetStats(). Databases created before the count was stored
+      # fall back to summing over all rows.
+      meta = session.query(Meta).filter(Meta.key == "token_count").first()
+      if meta:
+        return int(meta.value)
       return session.query(func.sum(EncodedContentFile.tokencount)).scalar()
 
   def IsDone(self, session: sqlutil.Session):
@@ -277,6 +282,8 @@ class EncodedContentFiles(sqlutil.Database):
   def SetStats(self, session: sqlutil.Session) -> None:
     """Write corpus stats to DB"""
     file_count      = session.query(EncodedContentFile.id).count()
+    token_count     = session.query(func.sum(EncodedContentFile.tokencount)).scalar() or 0
+    session.merge(Meta(key = "token_count", value = str(token_count)))
     if not self.is_pre_train:
       corpus_features = '\n\n'.join([ftype + ":\n" + mon.getStrData() for ftype, mon in self.feature_monitors.items()])
     else:
@@ -14,12 +14,15 @@
 # along with clgen.  If not, see <https://www.gnu.org/licenses/>.
 """The CLgen language model."""
 import os
+import signal
 import socket
 import getpass
 import pathlib
 import typing
 import datetime
 import humanize
+import threading
+import contextlib
 
 import numpy as np
 
@@ -68,6 +71,20 @@ flags.DEFINE_integer(
   "Bypass num_epochs provided by protobuf file."
 )
 
+@contextlib.contextmanager
+def _TerminateAsSystemExit():
+  """Turn SIGTERM into SystemExit so that finally clauses get to run."""
+  if threading.current_thread() is not threading.main_thread():
+    yield
+    return
+  def handler(signum, frame):
+    raise SystemExit(128 + signum)
+  previous = signal.signal(signal.SIGTERM, handler)
+  try:
+    yield
+  finally:
+    signal.signal(signal.SIGTERM, previous)
+
 class Model(object):
   """A CLgen language model.
 
@@ -394,22 +411,21 @@ class Model(object):
       raise ValueError("Unrecognized backend.")
 
     try:
-      seq_count, cont = 0, True
-      while cont:
-        cont, seq_count = sample_batch()
-        if sampler.is_live:
-          start_text = [str(input("Live Feed: "))]
-          while True:
-            try:
-              start_text.append(str(input()))
-            except EOFError:
-              break
-          sampler.start_text = '\n'.join(start_text)
-          sampler.Specialize(tokenizer)
+      with sample_observers_lib.FlushOnExit(sample_observers), _TerminateAsSystemExit():
+        seq_count, cont = 0, True
+        while cont:
+          cont, seq_count = sample_batch()
+          if sampler.is_live:
+            start_text = [str(input("Live Feed: "))]
+            while True:
+              try:
+                start_text.append(str(input()))
+              except EOFError:
+                break
+            sampler.start_text = '\n'.join(start_text)
+            sampler.Specialize(tokenizer)
     except KeyboardInterrupt:
       l.getLogger().info("Wrapping up sampling...")
-    except Exception as e:
-      raise e
 
     for obs in sample_observers:
       obs.endSample()
@@ -492,6 +508,7 @@ class Model(object):
     start_time = datetime.datetime.utcnow()
 
     self.backend.InitSampleBatch(sampler)
+    sampler.ResetTerminators()
     samples_in_progress = [
       sampler.tokenized_start_text.copy() for _ in range(sampler.batch_size)
     ]
@@ -503,6 +520,10 @@ class Model(object):
     # False, this value is set to False.
     continue_sampling = True
 
+    # Hoisted out of the per-token loop below.
+    decoder = tokenizer.decoder
+    sample_is_complete = sampler.SampleIsComplete
+
     # Sampling loop. Continues until all samples in the batch are done.
     while not done.all():
       indices = self.backend.SampleNextIndices(sampler, done)
@@ -513,25 +534,24 @@ class Model(object):
         if done[i]:
           continue
 
+        sample_in_progress = samples_in_progress[i]
         for index in indices[i]:
-          samples_in_progress[i].append(tokenizer.decoder[index])
-          step_ind             = ""
-          encoded_step_indices = ""
+          sample_in_progress.append(decoder[index])
 
-          if sampler.SampleIsComplete(samples_in_progress[i]):
+          if sample_is_complete(sample_in_progress):
             end_time       = datetime.datetime.utcnow()
-            sample_kernel  = [x for x in samples_in_progress[i]]
-            feature_vector = extractor.ExtractFeatures(''.join(samples_in_progress[i]))
+            sample_kernel  = [x for x in sample_in_progress]
+            feature_vector = extractor.ExtractFeatures(''.join(sample_in_progress))
             done[i]        = 1
             try:
-              stdout = opencl.Compile(''.join(samples_in_progress[i]))
+              stdout = opencl.Compile(''.join(sample_in_progress))
               compile_flag = True
             except ValueError:
               compile_flag = False
 
             sample = model_pb2.Sample(
               train_step                = epoch,
-              text                      = samples_in_progress[i],
+              text                      = sample_in_progress,
               sample_indices            = "",
               encoded_sample_indices    = "",
               sample_feed               = sampler.start_text,
@@ -540,7 +560,7 @@ class Model(object):
               sample_time_ms            = int(round(1000 * ((end_time - start_time) / sampler.batch_size).total_seconds())),
               wall_time_ms              = int(round(1000 * ((end_time - start_time) / sampler.batch_size).total_seconds())),
               feature_vector            = "\n".join(["{}:{}".format(k, v) for (k, v) in feature_vector.items()]),
-              num_tokens                = len(samples_in_progress[i]),
+              num_tokens                = len(sample_in_progress),
               compile_status            = compile_flag,
               categorical_sampling      = self.backend.samplesWithCategorical(),
               date_added                = datetime.datetime.utcnow().strftime("%m/%d/%Y, %H:%M:%S"),
@@ -114,6 +114,18 @@ class TrainingLogger(object):
       ]
     return
 
+  def jsonAccumulateLoss(self, data: typing.List[typing.Dict[str, typing.Any]]):
+    """Read total_loss from the per-step records of a training json log."""
+    self.telemetry = [
+      telemetry_pb2.ModelEpochTelemetry(
+        timestamp_unix_epoch_ms = '0',
+        epoch_num = x['step'],
+        epoch_wall_time_ms = int(round(x['batch_execution_time_ms'])) if "batch_execution_time_ms" in x else -1,
+        loss = x['total_loss'] if "total_loss" in x else -1.0,
+      ) for x in data
+    ]
+    return
+
   def EpochTelemetry(self) -> typing.List[telemetry_pb2.ModelEpochTelemetry]:
     """Return the epoch telemetry files."""
     if self.telemetry is None:
@@ -128,17 +140,12 @@ class TrainingLogger(object):
         event_acc = EventAccumulator(str(self.logdir))
         event_acc.Reload()
         self.tfAccumulateLoss(event_acc)
-      elif len(glob.glob(str(self.logdir / "training.json"))) == 1:
+      elif (self.logdir / "training.jsonl").exists():
+        with open(self.logdir / "training.jsonl", 'r') as jsf:
+          self.jsonAccumulateLoss([json.loads(line) for line in jsf if line.strip()])
+      elif (self.logdir / "training.json").exists():
         with open(self.logdir / "training.json", 'r') as jsf:
-          data = json.load(jsf)
-        self.telemetry = [
-          telemetry_pb2.ModelEpochTelemetry(
-            timestamp_unix_epoch_ms = '0',
-            epoch_num = x['step'],
-            epoch_wall_time_ms = int(round(x['batch_execution_time_ms'])) if "batch_execution_time_ms" in x else -1,
-            loss = x['total_loss'] if "total_loss" in x else -1.0,
-          ) for x in data
-        ]
+          self.jsonAccumulateLoss(json.load(jsf))
       else:
         l.getLogger().warn("Training logs have not been found. Invalid reported loss.")
         self.telemetry = [
@@ -321,38 +321,41 @@ class tfBert(backends.BackendBase):
         else:
           sampler, observers = self._getTestSampler(test_sampler, self.config.training.sequence_length)
           self.InitSampling(sampler, self.config.training.random_seed)
-          for ep in range(self.num_epochs):
-            self.train.estimator.train(input_fn = train_input_fn, steps = self.steps_per_epoch)
-            for _ in range(FLAGS.sample_per_epoch):
-              start_time   = datetime.datetime.utcnow()
-              self.InitSampleBatch()
-              sample_batch, sample_indices = self.SampleNextIndices()
-              end_time = datetime.datetime.utcnow()
-              for sample, sind in zip(sample_batch, sample_indices):
-
-                try:
-                  stdout = opencl.Compile(self.tokenizer.ArrayToCode(sample))
-                  compile_flag = 1
-                except ValueError:
-                  compile_flag = 0
-
-                feature_vector = extractor.ExtractFeatures(self.tokenizer.ArrayToCode(sample))
-                sample_proto = model_pb2.Sample(
-                  train_step             = (ep + 1) * self.steps_per_epoch,
-                  sample_feed            = sampler.start_text,
-                  text                   = self.tokenizer.tokensToString(sample, ignore_token = self.tokenizer.padToken).replace("\\n", "\n"),
-                  encoded_text           = ",".join([str(t) for t in sample]),
-                  sample_indices         = '\n'.join([self.tokenizer.tokensToString(mind).replace('\n', '\\n') for mind in sind]),
-                  encoded_sample_indices = '\n'.join([','.join([str(x) for x in mind]) for mind in sind ]),
-                  sample_time_ms         = int(round(1000 * ((end_time - start_time) / sampler.batch_size).total_seconds())),
-                  feature_vector         = "\n".join(["{}:{}".format(k, v) for (k, v) in feature_vector.items()]),
-                  num_tokens             = len(sample),
-                  compile_status         = compile_flag,
-                  categorical_sampling   = self.samplesWithCategorical(),
-                  date_added             = datetime.datetime.utcnow().strftime("%m/%d/%Y, %H:%M:%S"),
-                )
-                for obs in observers:
-                  obs.OnSample(sample_proto)
+          with sample_observers.FlushOnExit(observers):
+            for ep in range(self.num_epochs):
+              self.train.estimator.train(input_fn = train_input_fn, steps = self.steps_per_epoch)
+              for _ in range(FLAGS.sample_per_epoch):
+                start_time   = datetime.datetime.utcnow()
+                self.InitSampleBatch()
+                sample_batch, sample_indices = self.SampleNextIndices()
+                end_time = datetime.datetime.utcnow()
+                for sample, sind in zip(sample_batch, sample_indices):
+
+                  try:
+                    stdout = opencl.Compile(self.tokenizer.ArrayToCode(sample))
+                    compile_flag = 1
+                  except ValueError:
+                    compile_flag = 0
+
+                  feature_vector = extractor.ExtractFeatures(self.tokenizer.ArrayToCode(sample))
+                  sample_proto = model_pb2.Sample(
+                    train_step             = (ep + 1) * self.steps_per_epoch,
+                    sample_feed            = sampler.start_text,
+                    text                   = self.tokenizer.tokensToString(sample, ignore_token = self.tokenizer.padToken).replace("\\n", "\n"),
+                    encoded_text           = ",".join([str(t) for t in sample]),
+                    sample_indices         = '\n'.join([self.tokenizer.tokensToString(mind).replace('\n', '\\n') for mind in sind]),
+                    encoded_sample_indices = '\n'.join([','.join([str(x) for x in mind]) for mind in sind ]),
+                    sample_time_ms         = int(round(1000 * ((end_time - start_time) / sampler.batch_size).total_seconds())),
+                    feature_vector         = "\n".join(["{}:{}".format(k, v) for (k, v) in feature_vector.items()]),
+                    num_tokens             = len(sample),
+                    compile_status         = compile_flag,
+                    categorical_sampling   = self.samplesWithCategorical(),
+                    date_added             = datetime.datetime.utcnow().strftime("%m/%d/%Y, %H:%M:%S"),
+                  )
+                  for obs in observers:
+                    obs.OnSample(sample_proto)
+              for obs in observers:
+                obs.Flush()
       except KeyboardInterrupt:
         pass
       if not FLAGS.force_eval:
@@ -445,7 +448,6 @@ class tfBert(backends.BackendBase):
     return sampler, observers
 
   def GetShortSummary(self) -> str:
-    l.getLogger().debug("deeplearning.clgen.models.tf_bert.tfBert.GetShortSummary()")
     return (
       f"h_s: {self.config.architecture.hidden_size}, "
       f"#h_l: {self.config.architecture.num_hidden_layers}, "
@@ -464,7 +466,6 @@ class tfBert(backends.BackendBase):
       A list of absolute paths.
     """
     # The TensorFlow save file.
-    l.getLogger().debug("deeplearning.clgen.models.tf_bert.tfBert.InferenceManifest()")
     paths = [ path.absolute() for path in (self.cache.path / "checkpoints").iterdir() ]
     paths += [ path.absolute() for path in (self.cache.path / "logs").iterdir() ]
     paths += [ path.absolute() for path in (self.cache.path / "samples").iterdir() ]
@@ -88,6 +88,11 @@ class tfSequential(backends.BackendBase):
     self.inference_sess = None
     self.inference_indices = None
     self.inference_state = None
+    self._feed_indices = None
+    self._feed_lengths = None
+
+    # Cached result of is_trained. Reset whenever a new checkpoint is saved.
+    self._is_trained = None
 
     # Create the summary writer, shared between Train() and
     # _EndOfEpochTestSample().
@@ -474,6 +479,7 @@ class tfSequential(backends.BackendBase):
           f"{checkpoint_prefix}-{global_step}.index"
         ).is_file()
         assert pathlib.Path(f"{checkpoint_prefix}-{global_step}.meta").is_file()
+        self._is_trained = None
 
         self.telemetry.EpochEndCallback(epoch_num, loss)
         # If we have a sampler that we can use at the end of epochs, then
@@ -508,6 +514,7 @@ class tfSequential(backends.BackendBase):
       done = np.zeros(1, dtype=np.bool)
       start_time = time.time()
       sample_in_progress = sampler.tokenized_start_text.copy()
+      sampler.ResetTerminators()
 
       while not done[0]:
         indices, _ = self.SampleNextIndices(sampler, done)
@@ -572,6 +579,10 @@ class tfSequential(backends.BackendBase):
       np.random.seed(seed)
       self.inference_tf.compat.v1.set_random_seed(seed)
 
+    # Host-side feed buffers, re-used by every sampling step.
+    self._feed_indices = np.zeros((sampler.batch_size, sampler.sequence_length), dtype = np.int32)
+    self._feed_lengths = np.empty([sampler.batch_size], dtype = np.int32)
+
     # If --clgen_tf_backend_reset_inference_state_between_batches, the state
     # is reset at the beginning of every sample batch. Else, this is the only
     # place it is initialized.
@@ -606,16 +617,20 @@ class tfSequential(backends.BackendBase):
       self.inference_state = self.inference_sess.run(
         self.cell.get_initial_state(batch_size = sampler.batch_size, dtype = self.inference_tf.float32)
       )
-    self.inference_indices = np.tile(
-      sampler.encoded_start_text, [sampler.batch_size, 1]
+    # A read-only broadcast view: every batch row shares the same seed, and
+    # SampleNextIndices() copies it into the fed input array anyway.
+    self.inference_indices = np.broadcast_to(
+      sampler.encoded_start_text, (sampler.batch_size, len(sampler.encoded_start_text))
     )
 
   def SampleNextIndices(self, sampler: samplers.Sampler, done: np.ndarray):
     length = self.inference_indices.shape[1]
     assert length < sampler.sequence_length
-    expanded_indices = np.zeros((sampler.batch_size, sampler.sequence_length))
+    expanded_indices = self._feed_indices
+    expanded_indices.fill(0)
     expanded_indices[:, :length] = self.inference_indices
-    synthesized_lengths = np.full([sampler.batch_size], sampler.sequence_length)
+    synthesized_lengths = self._feed_lengths
+    synthesized_lengths.fill(sampler.sequence_length)
     synthesized_lengths[done] = 0
     feed = {
       self.initial_state: self.inference_state,
@@ -647,7 +662,7 @@ class tfSequential(backends.BackendBase):
 
   def ResetSampleState(self, sampler: samplers.Sampler, state, seed) -> None:
     self.inference_state = copy.deepcopy(state)
-    self.inference_indices = np.tile(seed, [sampler.batch_size, 1])
+    self.inference_indices = np.broadcast_to(seed, (sampler.batch_size, len(seed)))
 
   def EvaluateSampleState(self, sampler: samplers.Sampler):
     length = self.inference_indices.shape[1] - 1
@@ -656,9 +671,11 @@ class tfSequential(backends.BackendBase):
     last_indices = self.inference_indices[:, -1:]
     self.inference_indices = self.inference_indices[:, :-1]
 
-    expanded_indices = np.zeros((sampler.batch_size, sampler.sequence_length))
+    expanded_indices = self._feed_indices
+    expanded_indices.fill(0)
     expanded_indices[:, :length] = self.inference_indices
-    synthesized_lengths = np.full([sampler.batch_size], length)
+    synthesized_lengths = self._feed_lengths
+    synthesized_lengths.fill(length)
 
     feed = {
       self.initial_state: self.inference_state,
@@ -677,12 +694,11 @@ class tfSequential(backends.BackendBase):
   @property
   def is_trained(self) -> bool:
     """Determine if model has been trained."""
-    # Count the number of checkpoint files which TensorFlow has created.
-    checkpoint_files = [
-      f.stem
-      for f in (self.cache.path / "checkpoints").iterdir()
-      if f.name.startswith("checkpoint-") and f.name.endswith(".meta")
-    ]
-    epoch_nums = [int(x.split("-")[-1]) for x in checkpoint_files]
-    return self.config.training.num_epochs in epoch_nums
+    if self._is_trained is None:
+      # The checkpoint paths are appended with the epoch number.
+      self._is_trained = any(
+        int(f.stem.rsplit("-", 1)[1]) == self.config.training.num_epochs
+        for f in (self.cache.path / "checkpoints").glob("checkpoint-*.meta")
+      )
+    return self._is_trained
 
@@ -1,11 +1,17 @@
 import json
-import numpy as np
 import pathlib
+import typing
 
 from deeplearning.clgen.util import plotter
+from deeplearning.clgen.util.pytorch import torch
 from deeplearning.clgen.samplers import validation_database
 from eupy.native import logger as l
 
+def loadTensors(jsonfile: pathlib.Path) -> typing.List[typing.Dict[str, typing.Any]]:
+  """Load the per-step tensor records written by tensorMonitorHook, one JSON object per line."""
+  with open(jsonfile, 'r') as js:
+    return [json.loads(line) for line in js if line.strip()]
+
 class tensorMonitorHook(object):
   def __init__(self, 
                cache_path: pathlib.Path, 
@@ -20,12 +26,13 @@ class tensorMonitorHook(object):
     self.flush_freq       = flush_freq
     self.average          = average
 
-    self.jsonfile         = cache_path / "training.json"
+    self.jsonfile         = cache_path / "training.jsonl"
     self.tensors          = []
     self.plot_tensors     = {}
     self.epoch_tensors    = {}
     self.epch_loss        = []
-    self.delay_checkpoint = True if current_step != 0 else False
+    # When resuming, the first step after the checkpoint is not logged.
+    self.resume_step      = current_step + 1 if current_step != 0 else -1
     self._initTensors()
 
     self.monitor_func = [
@@ -49,8 +56,8 @@ class tensorMonitorHook(object):
       else:
         self.epoch_tensors[key] = value
 
-    self.current_step += 1
-    if self._step_triggered():
+    self._advance()
+    if self._should_log():
       self._logTensors()
       self.epoch_tensors = {}
     return
@@ -60,7 +67,7 @@ class tensorMonitorHook(object):
       if value is None:
         continue
       self.epoch_tensors[key] = value
-    # if self._step_triggered():
+    # if self._should_log():
     self._logTensors()
     self.epoch_tensors = {}
     self.epch_loss = []
@@ -68,37 +75,49 @@ class tensorMonitorHook(object):
 
   def _initTensors(self):
     if self.current_step > 0:
+      legacy_jsonfile = self.cache_path / "training.json"
       if self.jsonfile.exists():
-        with open(self.jsonfile, 'r') as js:
+        loaded_tensors = loadTensors(self.jsonfile)
+      elif legacy_jsonfile.exists():
+        with open(legacy_jsonfile, 'r') as js:
           loaded_tensors = json.load(js)
-          if loaded_tensors[-1]['step'] > self.current_step:
-            # If previous sessions have written beyond current step, overwrite them.
-            back_index = -2
-            while loaded_tensors[back_index]['step'] > self.current_step:
-              back_index -= 1
-            self.tensors = loaded_tensors[:back_index + 1]
-          else:
-            self.tensors = loaded_tensors
-
-          for ch in self.tensors:
-            for k, v in ch.items():
-              if k == 'step':
-                continue
-              if k not in self.plot_tensors:
-                self.plot_tensors[k] = {'value': [], 'step': []}
-              self.plot_tensors[k]['value'].append(v)
-              self.plot_tensors[k]['step'].append(ch['step'])
       else:
         raise FileNotFoundError(self.jsonfile)
+
+      if loaded_tensors[-1]['step'] > self.current_step:
+        # If previous sessions have written beyond current step, overwrite them.
+        back_index = -2
+        while loaded_tensors[back_index]['step'] > self.current_step:
+          back_index -= 1
+        self.tensors = loaded_tensors[:back_index + 1]
+      else:
+        self.tensors = loaded_tensors
+
+      # Rewrite the log once, so that _tensor2JSON only has to append to it.
+      with open(self.jsonfile, 'w') as js:
+        for ch in self.tensors:
+          js.write(json.dumps(ch) + "\n")
+
+      for ch in self.tensors:
+        for k, v in ch.items():
+          if k == 'step':
+            continue
+          if k not in self.plot_tensors:
+            self.plot_tensors[k] = {'value': [], 'step': []}
+          self.plot_tensors[k]['value'].append(v)
+          self.plot_tensors[k]['step'].append(ch['step'])
+    elif self.jsonfile.exists():
+      # Fresh training session. Start a new log.
+      self.jsonfile.unlink()
     return
 
-  def _step_triggered(self):
-    if self.delay_checkpoint:
-      self.delay_checkpoint = False
-      return False
-    if (self.current_step) % self.step_freq == 0 or self.current_step - 1 == 0:
-      return True
-    return False
+  def _advance(self):
+    self.current_step += 1
+    return
+
+  def _should_log(self):
+    step = self.current_step
+    return step != self.resume_step and (step % self.step_freq == 0 or step == 1)
 
   def _logTensors(self):
 
@@ -129,8 +148,8 @@ class tensorMonitorHook(object):
     return
 
   def _tensor2JSON(self):
-    with open(self.jsonfile, 'w') as js:
-      json.dump(self.tensors, js, indent = 2, sort_keys = True)
+    with open(self.jsonfile, 'a') as js:
+      js.write(json.dumps(self.tensors[-1]) + "\n")
     return
 
   def _tensor2plot(self):
@@ -173,25 +192,40 @@ class validationSampleHook(object):
       Requested tensors are evaluated and their values are available
     """
 
-    seen_in_training      = inputs['seen_in_training'].numpy()
-    original_input        = inputs['original_input'].numpy()
-    masked_lm_lengths     = inputs['masked_lm_lengths'].numpy()
-    input_ids             = inputs['input_ids'].cpu().numpy()
-    input_mask            = inputs['input_mask'].cpu().numpy()
-    next_sentence_labels  = inputs['next_sentence_labels'].cpu().numpy()
-    mask_labels           = inputs['mask_labels'].cpu().numpy()
-    pred_logits           = outputs['prediction_logits'].cpu().numpy()
-    seq_rel_logits        = outputs['seq_relationship_logits'].cpu().numpy()
+    # Reduce the logits to predicted ids on device, so that only small integer
+    # tensors have to be copied back. All copies are issued asynchronously and
+    # waited on once.
+    seq_rel_logits = outputs['seq_relationship_logits']
+    device_tensors = {
+      'input_ids'                 : inputs['input_ids'],
+      'input_mask'                : inputs['input_mask'],
+      'next_sentence_labels'      : inputs['next_sentence_labels'],
+      'mask_labels'               : inputs['mask_labels'],
+      'pred_ids'                  : outputs['prediction_logits'].argmax(dim = -1),
+      'next_sentence_predictions' : seq_rel_logits.argmax(dim = -1),
+    }
+    host_tensors = {k: v.to('cpu', non_blocking = True) for k, v in device_tensors.items()}
+    if any(v.is_cuda for v in device_tensors.values()):
+      torch.cuda.current_stream().synchronize()
+
+    seen_in_training          = inputs['seen_in_training'].numpy()
+    original_input            = inputs['original_input'].numpy()
+    masked_lm_lengths         = inputs['masked_lm_lengths'].numpy()
+    input_ids                 = host_tensors['input_ids'].numpy()
+    input_mask                = host_tensors['input_mask'].numpy()
+    next_sentence_labels      = host_tensors['next_sentence_labels'].numpy()
+    mask_labels               = host_tensors['mask_labels'].numpy()
+    pred_ids                  = host_tensors['pred_ids'].numpy()
+    next_sentence_predictions = host_tensors['next_sentence_predictions'].numpy()
 
-    batch_size = len(pred_logits)
+    batch_size = len(pred_ids)
 
     masked_lm_ids = [[x for x in batch if x != -100] for batch in mask_labels]
     masked_lm_positions = [[idx for idx, x in enumerate(batch) if x != -100] for batch in mask_labels]
     masked_lm_predictions = [
-          [np.argmax(pred_logits[batch][x]) for x in masked_lm_positions[batch]]
+          [pred_ids[batch][x] for x in masked_lm_positions[batch]]
           for batch in range(batch_size)
         ]
-    next_sentence_predictions = [[np.argmax(x) for x in batch][-1] for batch in seq_rel_logits]
 
     for target, prediction in zip(masked_lm_ids, masked_lm_predictions):
       if target == prediction:
@@ -580,6 +580,8 @@ class torchBert(backends.BackendBase):
           set_mail = "Epoch {} Loss: {}\n".format(self.current_step // self.steps_per_epoch, train_hook.epoch_loss)
           l.getLogger().info("Epoch {} Loss: {}".format(self.current_step // self.steps_per_epoch, train_hook.epoch_loss), mail_level = 4)
           self.saveCheckpoint(self.train, pre_train)
+          if correct_sample_obs is not None:
+            correct_sample_obs.Flush()
 
           if FLAGS.validate_per_epoch and self.train.data_generator.config.validation_split > 0:
             val_ml_loss, val_nsp_loss = self.Validate(per_epoch = True, pre_train = pre_train)
@@ -601,38 +603,42 @@ class torchBert(backends.BackendBase):
           if FLAGS.sample_per_epoch:
             sampler, observers = self._getTestSampler(test_sampler, self.config.training.sequence_length)
             self.InitSampling(sampler, self.config.training.random_seed)
-            for _ in range(FLAGS.sample_per_epoch):
-              start_time   = datetime.datetime.utcnow()
-              self.InitSampleBatch(sampler)
-              org_inputs, input_ids, samples, indices = self.SampleNextIndices()
-              end_time = datetime.datetime.utcnow()
-              for org, inp, sample, idxs in zip(org_inputs, input_ids, samples, indices):
-                try:
-                  stdout = opencl.Compile(self.tokenizer.ArrayToCode(sample))
-                  compile_flag = 1
-                except ValueError:
-                  compile_flag = 0
-
-                feature_vector = extractor.ExtractFeatures(self.tokenizer.ArrayToCode(sample))
-                sample_proto = model_pb2.Sample(
-                  train_step             = self.current_step,
-                  sample_feed            = sampler.start_text,
-                  original_input         = self.tokenizer.tokensToString(org,    with_formatting = True, ignore_token = self.tokenizer.padToken),
-                  text                   = self.tokenizer.tokensToString(sample, with_formatting = True, ignore_token = self.tokenizer.padToken).replace("\\n", "\n"),
-                  encoded_text           = ",".join([str(t) for t in sample]),
-                  sample_indices         = '\n'.join([','.join([self.tokenizer.decoder[idx] for idx in hole_idxs]).replace('\n', '\\n') for hole_idxs in idxs]),
-                  encoded_sample_indices = '\n'.join([','.join([str(idx) for idx in hole_idxs]) for hole_idxs in idxs]),
-                  sample_time_ms         = int(round(1000 * ((end_time - start_time) / sampler.batch_size).total_seconds())),
-                  feature_vector         = "\n".join(["{}:{}".format(k, v) for (k, v) in feature_vector.items()]),
-                  num_tokens             = len(sample),
-                  compile_status         = compile_flag,
-                  categorical_sampling   = self.samplesWithCategorical(),
-                  date_added             = datetime.datetime.utcnow().strftime("%m/%d/%Y, %H:%M:%S"),
-                )
-                for obs in observers:
-                  obs.OnSample(sample_proto)
+            with sample_observers.FlushOnExit(observers):
+              for _ in range(FLAGS.sample_per_epoch):
+                start_time   = datetime.datetime.utcnow()
+                self.InitSampleBatch(sampler)
+                org_inputs, input_ids, samples, indices = self.SampleNextIndices()
+                end_time = datetime.datetime.utcnow()
+                for org, inp, sample, idxs in zip(org_inputs, input_ids, samples, indices):
+                  try:
+                    stdout = opencl.Compile(self.tokenizer.ArrayToCode(sample))
+                    compile_flag = 1
+                  except ValueError:
+                    compile_flag = 0
+
+                  feature_vector = extractor.ExtractFeatures(self.tokenizer.ArrayToCode(sample))
+                  sample_proto = model_pb2.Sample(
+                    train_step             = self.current_step,
+                    sample_feed            = sampler.start_text,
+                    original_input         = self.tokenizer.tokensToString(org,    with_formatting = True, ignore_token = self.tokenizer.padToken),
+                    text                   = self.tokenizer.tokensToString(sample, with_formatting = True, ignore_token = self.tokenizer.padToken).replace("\\n", "\n"),
+                    encoded_text           = ",".join([str(t) for t in sample]),
+                    sample_indices         = '\n'.join([','.join([self.tokenizer.decoder[idx] for idx in hole_idxs]).replace('\n', '\\n') for hole_idxs in idxs]),
+                    encoded_sample_indices = '\n'.join([','.join([str(idx) for idx in hole_idxs]) for hole_idxs in idxs]),
+                    sample_time_ms         = int(round(1000 * ((end_time - start_time) / sampler.batch_size).total_seconds())),
+                    feature_vector         = "\n".join(["{}:{}".format(k, v) for (k, v) in feature_vector.items()]),
+                    num_tokens             = len(sample),
+                    compile_status         = compile_flag,
+                    categorical_sampling   = self.samplesWithCategorical(),
+                    date_added             = datetime.datetime.utcnow().strftime("%m/%d/%Y, %H:%M:%S"),
+                  )
+                  for obs in observers:
+                    obs.OnSample(sample_proto)
       except KeyboardInterrupt:
         pass
+      finally:
+        if correct_sample_obs is not None:
+          correct_sample_obs.Flush()
 
       if not FLAGS.force_eval:
         _, _ = self.Validate(pre_train = pre_train)
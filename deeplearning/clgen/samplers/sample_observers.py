@@ -13,7 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with clgen.  If not, see <https://www.gnu.org/licenses/>.
 """This file contains the SampleObserver interface and concrete subclasses."""
+import contextlib
 import pathlib
+import threading
+import typing
+import sqlalchemy
 
 from deeplearning.clgen.proto import model_pb2
 from absl import flags
@@ -23,6 +27,7 @@ from deeplearning.clgen.util import monitors
 from deeplearning.clgen.samplers import samples_database
 from deeplearning.clgen.features import extractor
 from labm8.py import fs
+from eupy.native import logger as l
 
 FLAGS = flags.FLAGS
 
@@ -63,9 +68,25 @@ class SampleObserver(object):
     """
     raise NotImplementedError("abstract class")
 
+  def Flush(self) -> None:
+    """Write out any samples that the observer has buffered.
+
+    Subclasses that buffer samples must override this method.
+    """
+    pass
+
   def endSample(self) -> None:
     pass
 
+@contextlib.contextmanager
+def FlushOnExit(observers: typing.List[SampleObserver]):
+  """Flush the sample observers when the block exits, even if it raises."""
+  try:
+    yield
+  finally:
+    for obs in observers:
+      obs.Flush()
+
 class MaxSampleCountObserver(SampleObserver):
   """An observer that terminates sampling after a finite number of samples."""
 
@@ -133,32 +154,61 @@ class SamplesDatabaseObserver(SampleObserver):
   ):
     self.db = samples_database.SamplesDatabase("sqlite:///{}".format(str(path)), must_exist = must_exist)
     self.sample_id = self.db.count
+    self.flush_secs = flush_secs
+    self.commit_sample_frequency = commit_sample_frequency
     self.plot_sample_status = plot_sample_status
     if self.plot_sample_status:
       self.saturation_monitor = monitors.CumulativeHistMonitor(path.parent, "cumulative_sample_count")
 
+    # Samples that have not been written to the database yet.
+    self.pending_samples = []
+    self.pending_sha256  = set()
+    # Flushes pending samples flush_secs after the first one is buffered, so a
+    # stalled sampler does not hold them back indefinitely.
+    self.flush_lock      = threading.RLock()
+    self.flush_timer     = None
+
   def OnSample(self, sample: model_pb2.Sample) -> bool:
     """Sample receive callback."""
-
-    with self.db.Session(commit = True) as session:
-      db_sample = samples_database.Sample(
-        **samples_database.Sample.FromProto(self.sample_id, sample)
-      )
-      try:
-        exists = session.query(samples_database.Sample.sha256).filter_by(sha256 = db_sample.sha256).scalar() is not None
-      except sqlalchemy.orm.exc.MultipleResultsFound as e:
-        l.getLogger().error("Selected sha256 has been already found more than once.")
-        raise e
-      if not exists:
-        session.add(db_sample)
-        self.sample_id += 1
-      if self.plot_sample_status:
-        self.saturation_monitor.register(self.sample_id)
-        self.saturation_monitor.plot()
+    db_sample = samples_database.Sample.FromProto(self.sample_id, sample)
+    with self.flush_lock:
+      if db_sample["sha256"] not in self.pending_sha256:
+        with self.db.Session() as session:
+          try:
+            exists = session.query(samples_database.Sample.sha256).filter_by(sha256 = db_sample["sha256"]).scalar() is not None
+          except sqlalchemy.orm.exc.MultipleResultsFound as e:
+            l.getLogger().error("Selected sha256 has been already found more than once.")
+            raise e
+        if not exists:
+          self.pending_samples.append(db_sample)
+          self.pending_sha256.add(db_sample["sha256"])
+          self.sample_id += 1
+          if self.flush_timer is None:
+            self.flush_timer = threading.Timer(self.flush_secs, self.Flush)
+            self.flush_timer.daemon = True
+            self.flush_timer.start()
+      if len(self.pending_samples) >= self.commit_sample_frequency:
+        self.Flush()
+    if self.plot_sample_status:
+      self.saturation_monitor.register(self.sample_id)
+      self.saturation_monitor.plot()
     return True
 
+  def Flush(self) -> None:
+    """Write buffered samples to the database."""
+    with self.flush_lock:
+      if self.flush_timer is not None:
+        self.flush_timer.cancel()
+        self.flush_timer = None
+      if self.pending_samples:
+        self.db.BulkAdd(self.pending_samples)
+        self.pending_samples = []
+        self.pending_sha256  = set()
+    return
+
   def endSample(self) -> None:
     """Write final summed data about sampling session."""
+    self.Flush()
     # Create feature vector plots
     db_path = pathlib.Path(self.db.url[len("sqlite:///"):]).parent
     feature_monitor = monitors.CategoricalDistribMonitor(db_path, "samples_feature_vector_distribution")
@@ -0,0 +1,88 @@
+"""Unit tests for deeplearning.clgen.samplers.sample_observers."""
+import pathlib
+import time
+
+from deeplearning.clgen.proto import model_pb2
+from deeplearning.clgen.samplers import sample_observers
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+def _Sample(text: str, sample_time_ms: int = 1) -> model_pb2.Sample:
+  return model_pb2.Sample(
+    train_step     = 0,
+    text           = text,
+    encoded_text   = "1,2,3",
+    sample_time_ms = sample_time_ms,
+    num_tokens     = 3,
+    compile_status = True,
+    date_added     = "01/02/2021, 03:04:05",
+  )
+
+def _Texts(observer: sample_observers.SamplesDatabaseObserver) -> set:
+  with observer.db.Session() as s:
+    return {sample.text for sample in s.query(sample_observers.samples_database.Sample)}
+
+@test.Fixture(scope = "function")
+def observer(tempdir: pathlib.Path) -> sample_observers.SamplesDatabaseObserver:
+  obs = sample_observers.SamplesDatabaseObserver(tempdir / "samples.db", flush_secs = 3600)
+  yield obs
+  obs.Flush()
+
+def test_SamplesDatabaseObserver_buffers_until_Flush(observer):
+  """Test that samples are only written when the observer is flushed."""
+  observer.OnSample(_Sample("a"))
+  observer.OnSample(_Sample("b"))
+  assert _Texts(observer) == set()
+  observer.Flush()
+  assert _Texts(observer) == {"a", "b"}
+  assert observer.pending_samples == []
+
+def test_SamplesDatabaseObserver_skips_duplicates(observer):
+  """Test that a sample text is stored only once."""
+  observer.OnSample(_Sample("a"))
+  observer.OnSample(_Sample("a"))
+  observer.Flush()
+  observer.OnSample(_Sample("a"))
+  observer.Flush()
+  assert observer.db.count == 1
+
+def test_SamplesDatabaseObserver_flushes_at_commit_sample_frequency(tempdir: pathlib.Path):
+  """Test that a full buffer is flushed without an explicit Flush()."""
+  observer = sample_observers.SamplesDatabaseObserver(
+    tempdir / "samples.db", flush_secs = 3600, commit_sample_frequency = 2
+  )
+  observer.OnSample(_Sample("a"))
+  observer.OnSample(_Sample("b"))
+  assert _Texts(observer) == {"a", "b"}
+
+def test_SamplesDatabaseObserver_flushes_on_timer_expiry(tempdir: pathlib.Path):
+  """Test that buffered samples are written after flush_secs with no new samples."""
+  observer = sample_observers.SamplesDatabaseObserver(tempdir / "samples.db", flush_secs = 0.1)
+  observer.OnSample(_Sample("a"))
+  deadline = time.time() + 10
+  while not _Texts(observer) and time.time() < deadline:
+    time.sleep(0.05)
+  assert _Texts(observer) == {"a"}
+  assert observer.flush_timer is None
+
+def test_SamplesDatabaseObserver_clamps_negative_sample_time(observer):
+  """Test that a wall clock stepping back does not lose the batch."""
+  observer.OnSample(_Sample("a", sample_time_ms = -5))
+  observer.OnSample(_Sample("b"))
+  observer.Flush()
+  assert _Texts(observer) == {"a", "b"}
+  with observer.db.Session() as s:
+    sample = s.query(sample_observers.samples_database.Sample).filter_by(text = "a").one()
+    assert sample.sample_time_ms == 0
+
+def test_FlushOnExit_flushes_on_exception(observer):
+  """Test that buffered samples are written if the sampling loop raises."""
+  with test.Raises(ValueError):
+    with sample_observers.FlushOnExit([observer]):
+      observer.OnSample(_Sample("a"))
+      raise ValueError("sampling crashed")
+  assert _Texts(observer) == {"a"}
+
+if __name__ == "__main__":
+  test.Main()
@@ -18,7 +18,9 @@ A Sampler is an object which, when passed to a mode's Sample() method,
 determines the shape of the generated samples.
 """
 import os
+import collections
 import datetime
+import functools
 import typing
 import pathlib
 import pickle
@@ -43,9 +45,23 @@ FLAGS = flags.FLAGS
 
 Base = declarative.declarative_base()
 
+@functools.lru_cache(maxsize = 128)
+def _HashConfigBytes(config_bytes: bytes) -> str:
+  """Memoized sha1 of a serialized sampler config."""
+  return crypto.sha1(config_bytes)
+
+# Serialized sampler configs that have passed AssertConfigIsValid(), in LRU
+# order. Bounded to _VALID_CONFIGS_MAX_SIZE entries.
+_VALID_CONFIGS = collections.OrderedDict()
+_VALID_CONFIGS_MAX_SIZE = 128
+
 def AssertConfigIsValid(config: sampler_pb2.Sampler) -> sampler_pb2.Sampler:
   """Assert that a sampler configuration contains no invalid values.
 
+  Configs that have already been validated are remembered by their serialized
+  bytes and are not checked again, unless they sample from a corpus: checking
+  a corpus depends on the filesystem and on --clgen_local_path_prefix.
+
   Args:
     config: A sampler configuration proto.
 
@@ -55,6 +71,20 @@ def AssertConfigIsValid(config: sampler_pb2.Sampler) -> sampler_pb2.Sampler:
   Raises:
     UserError: If there are configuration errors.
   """
+  key = config.SerializeToString()
+  if key in _VALID_CONFIGS:
+    _VALID_CONFIGS.move_to_end(key)
+    return config
+  _AssertConfigIsValid(config)
+  if config.HasField("sample_corpus") and config.sample_corpus.HasField("corpus"):
+    return config
+  _VALID_CONFIGS[key] = True
+  if len(_VALID_CONFIGS) > _VALID_CONFIGS_MAX_SIZE:
+    _VALID_CONFIGS.popitem(last = False)
+  return config
+
+def _AssertConfigIsValid(config: sampler_pb2.Sampler) -> sampler_pb2.Sampler:
+  """Uncached implementation of AssertConfigIsValid()."""
   try:
     if config.HasField("start_text"):
       pbutil.AssertFieldConstraint(
@@ -173,6 +203,13 @@ class TerminationCriterionBase(object):
     """
     pass
 
+  def Reset(self) -> None:
+    """Discard any state kept between calls to SampleIsComplete().
+
+    Called by the sampling loop before a new batch of samples is started.
+    """
+    pass
+
   def SampleIsComplete(self, sample_in_progress: typing.List[str]) -> bool:
     """Determine whether to stop sampling.
 
@@ -233,6 +270,9 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
       raise ValueError(e)
     if self.left_token == self.right_token:
       raise ValueError("SymmetricalTokenDepth tokens must be different")
+    # Running token counts, keyed by id() of each sample-in-progress. Each
+    # entry is [sample_in_progress, num_tokens_counted, left_count, right_count].
+    self.depth_counts = {}
 
   def Specialize(self, tokenizer: tokenizers.TokenizerBase) -> None:
     """Specialize a termination criteria to a vocabulary.
@@ -263,13 +303,34 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
         "corpus vocabulary"
       )
 
+  def Reset(self) -> None:
+    """Drop the running token counts of previous samples."""
+    self.depth_counts = {}
+
   def SampleIsComplete(self, sample_in_progress: typing.List[str]) -> bool:
-    """Determine whether to stop sampling."""
+    """Determine whether to stop sampling.
+
+    Token counts are kept per sample-in-progress, so that every call only
+    counts the tokens appended since the previous call on the same sample.
+    """
     if len(sample_in_progress) == 0:
       return False
+    counts = self.depth_counts.get(id(sample_in_progress))
+    if (counts is None
+        or counts[0] is not sample_in_progress
+        or counts[1] > len(sample_in_progress)):
+      counts = [sample_in_progress, 0, 0, 0]
+      self.depth_counts[id(sample_in_progress)] = counts
+    if counts[1] < len(sample_in_progress):
+      new_tokens = sample_in_progress[counts[1]:]
+      counts[2] += new_tokens.count(self.left_token)
+      counts[3] += new_tokens.count(self.right_token)
+      counts[1] = len(sample_in_progress)
+
     if not sample_in_progress[-1] == self.right_token:
       return False
-    return self.GetTokenDepth(sample_in_progress) == 0
+    # Same as GetTokenDepth() == 0, given that the last token is the right one.
+    return counts[2] == 0 or counts[2] == counts[3]
 
   def GetTokenDepth(self, sample_in_progress: typing.List[str]) -> int:
     """Calculate the symmetrical token depth.
@@ -371,6 +432,9 @@ class Sampler(object):
     self.config.CopyFrom(AssertConfigIsValid(config))
     self.hash = self._ComputeHash(self.config)
     self.terminators = GetTerminationCriteria(self.config.termination_criteria)
+    # SampleIsComplete() short-circuits, so check the O(1) max length criterion
+    # before the ones that have to look at the sample's tokens.
+    self.terminators.sort(key = lambda t: 0 if isinstance(t, MaxlenTerminationCriterion) else 1)
     if config.HasField("start_text"):
       self.start_text = self.config.start_text
     else:
@@ -408,13 +472,25 @@ class Sampler(object):
 
     meta = internal_pb2.SamplerMeta()
     meta.config.CopyFrom(self.config)
-    pbutil.ToFile(meta, path = self.cache.path / "META.pbtxt")
+    if not self._MetaIsUpToDate(meta):
+      pbutil.ToFile(meta, path = self.cache.path / "META.pbtxt")
     commit.saveCommit(self.cache.path)
 
     # Set in Specialize().
     self.encoded_start_text = None
     self.tokenized_start_text = None
 
+  def _MetaIsUpToDate(self, meta: internal_pb2.SamplerMeta) -> bool:
+    """Return True if the cached META.pbtxt already holds the given meta."""
+    meta_path = self.cache.path / "META.pbtxt"
+    if not meta_path.is_file():
+      return False
+    try:
+      cached_meta = pbutil.FromFile(meta_path, internal_pb2.SamplerMeta())
+    except pbutil.DecodeError:
+      return False
+    return cached_meta.config.SerializeToString() == meta.config.SerializeToString()
+
   def setStartText(self, start_text: str):
     """
       Assign current start_text used to sample. This function lazily assigns self.start_text and
@@ -469,18 +545,17 @@ class Sampler(object):
     sampled with symbolic links created in this function.
     """
     assert os.path.isdir(db_path), "Parent path of database is not an existing path!"
-    (self.samples_directory / model_hash).mkdir(exist_ok = True)
-
-    for file in db_path.iterdir():
-      symlink = self.samples_directory / model_hash / file.name
-      if not symlink.is_symlink():
-        os.symlink(
-          os.path.relpath(
-            db_path / file.name,
-            self.samples_directory / model_hash
-          ),
-          symlink
-        )
+    link_dir = self.samples_directory / model_hash
+    link_dir.mkdir(exist_ok = True)
+
+    # All links point into the same directory, so its relative path is computed once.
+    rel_db_path = os.path.relpath(db_path, link_dir)
+    with os.scandir(db_path) as it:
+      for file in it:
+        try:
+          os.symlink(os.path.join(rel_db_path, file.name), link_dir / file.name)
+        except FileExistsError:
+          pass
     return
 
   def symlinkSampleCorpus(self,
@@ -514,6 +589,11 @@ class Sampler(object):
     """
     return any(t.SampleIsComplete(sample_in_progress) for t in self.terminators)
 
+  def ResetTerminators(self) -> None:
+    """Reset the termination criteria before starting a new batch of samples."""
+    for t in self.terminators:
+      t.Reset()
+
   @staticmethod
   def _ComputeHash(config: sampler_pb2.Sampler) -> str:
     """Compute sampler hash.
@@ -521,7 +601,7 @@ class Sampler(object):
     The hash is computed from the serialized representation of the config
     proto.
     """
-    return crypto.sha1(config.SerializeToString())
+    return _HashConfigBytes(config.SerializeToString())
 
   def __eq__(self, rhs) -> bool:
     if not isinstance(rhs, Sampler):
@@ -4,6 +4,7 @@ import datetime
 import typing
 import sqlite3
 
+import numpy as np
 import sqlalchemy as sql
 from sqlalchemy.ext import declarative
 from absl import flags
@@ -17,6 +18,16 @@ FLAGS = flags.FLAGS
 
 Base = declarative.declarative_base()
 
+def EncodedTextToBytes(encoded_text: str) -> bytes:
+  """Pack comma-separated vocabulary indices into the bytes of an np.int32 array."""
+  if not encoded_text:
+    return b""
+  return np.array(encoded_text.split(','), dtype = np.int32).tobytes()
+
+def DateToEpochMs(date: datetime.datetime) -> int:
+  """Milliseconds since the epoch of a naive UTC datetime."""
+  return int(date.replace(tzinfo = datetime.timezone.utc).timestamp() * 1000)
+
 class SampleResults(Base):
   __tablename__ = "sampling_results"
   """
@@ -31,6 +42,9 @@ class Sample(Base, sqlutil.ProtoBackedMixin):
   This is the clgen.Sample protocol buffer in SQL format.
   """
   __tablename__    = "samples"
+  __table_args__   = (
+    sql.Index("ix_samples_tokens_time", "num_tokens", "date_added"),
+  )
   # entry id
   id                     : int = sql.Column(sql.Integer,    primary_key = True)
   # unique hash of sample text
@@ -45,8 +59,8 @@ class Sample(Base, sqlutil.ProtoBackedMixin):
   text                   : str = sql.Column(sqlutil.ColumnTypes.UnboundedUnicodeText(), nullable = False)
   # Array of the actual generated tokens
   sample_indices         : str = sql.Column(sqlutil.ColumnTypes.UnboundedUnicodeText(), nullable = False)
-  # encoded sample text
-  encoded_text           : str = sql.Column(sqlutil.ColumnTypes.UnboundedUnicodeText(), nullable = False)
+  # encoded sample text, as the raw bytes of an np.int32 array
+  encoded_text           : bytes = sql.Column(sql.LargeBinary(), nullable = False)
   # Encoded generated tokens
   encoded_sample_indices : str = sql.Column(sqlutil.ColumnTypes.UnboundedUnicodeText(), nullable = False)
   # Whether the generated sample compiles or not.
@@ -54,13 +68,23 @@ class Sample(Base, sqlutil.ProtoBackedMixin):
   # Sample's vector of features.
   feature_vector         : str = sql.Column(sqlutil.ColumnTypes.UnboundedUnicodeText(), nullable = False)
   # Length of total sequence in number of tokens
-  num_tokens             : int = sql.Column(sql.Integer,   nullable = False)
+  num_tokens             : int = sql.Column(sql.Integer,   nullable = False, index = True)
   # If Bernoulli distribution was used during samplinng
   categorical_sampling   : str = sql.Column(sql.String(8), nullable = False)
   # Time
   sample_time_ms         : int = sql.Column(sql.Integer,   nullable = False)
-  # Date
-  date_added             : datetime.datetime = sql.Column(sql.DateTime, nullable=False)
+  # Date, in UTC milliseconds since the epoch
+  date_added             : int = sql.Column(sql.BigInteger, nullable = False, index = True)
+
+  @property
+  def encoded_text_array(self) -> np.ndarray:
+    """Encoded sample text as an array of vocabulary indices."""
+    return np.frombuffer(self.encoded_text, dtype = np.int32)
+
+  @property
+  def date_added_datetime(self) -> datetime.datetime:
+    """UTC date the sample was added."""
+    return datetime.datetime.utcfromtimestamp(self.date_added / 1000)
 
   @classmethod
   def FromProto(cls, id: int, proto: model_pb2.Sample) -> typing.Dict[str, typing.Any]:
@@ -68,7 +92,7 @@ class Sample(Base, sqlutil.ProtoBackedMixin):
       "id"                     : id,
       "sha256"                 : crypto.sha256_str(proto.text),
       "train_step"             : proto.train_step,
-      "encoded_text"           : proto.encoded_text,
+      "encoded_text"           : EncodedTextToBytes(proto.encoded_text),
       "original_input"         : proto.original_input,
       "sample_feed"            : proto.sample_feed,
       "text"                   : proto.text,
@@ -78,15 +102,120 @@ class Sample(Base, sqlutil.ProtoBackedMixin):
       "num_tokens"             : proto.num_tokens,
       "compile_status"         : proto.compile_status,
       "categorical_sampling"   : proto.categorical_sampling,
-      "sample_time_ms"         : proto.sample_time_ms,
-      "date_added"             : datetime.datetime.strptime(proto.date_added, "%m/%d/%Y, %H:%M:%S"),
+      # Clamped, since a wall clock stepping back yields negative durations.
+      "sample_time_ms"         : max(0, proto.sample_time_ms),
+      "date_added"             : DateToEpochMs(datetime.datetime.strptime(proto.date_added, "%m/%d/%Y, %H:%M:%S")),
     }
 
+_SAMPLE_COLUMNS = [c.name for c in Sample.__table__.columns]
+_SAMPLE_INSERT_QUERY = "INSERT INTO {} ({}) VALUES ({})".format(
+  Sample.__tablename__, ", ".join(_SAMPLE_COLUMNS), ", ".join("?" * len(_SAMPLE_COLUMNS)),
+)
+# Bump this when a new one-time migration is added to _MigrateSchema().
+_SCHEMA_VERSION = 1
+
 class SamplesDatabase(sqlutil.Database):
   """A database of CLgen samples."""
 
   def __init__(self, url: str, must_exist: bool = False):
     super(SamplesDatabase, self).__init__(url, Base, must_exist = must_exist)
+    # Samples are appended in batches while the model keeps sampling, so readers
+    # should not block the writer, and a commit does not need a full fsync.
+    sqlutil.SetSqlitePragmasOnConnect(self.engine, ["journal_mode=WAL", "synchronous=NORMAL"])
+    self._MigrateSchema()
+
+  def _MigrateSchema(self) -> None:
+    """Run the one-time migrations of SQLite databases older than _SCHEMA_VERSION."""
+    if self.engine.dialect.name != "sqlite":
+      return
+    with self.engine.connect() as connection:
+      version = connection.execute("PRAGMA user_version").scalar()
+    if version >= _SCHEMA_VERSION:
+      return
+    self.MigrateEncodedText()
+    self.MigrateDateAdded()
+    self.CreateIndexes()
+    with self.engine.connect() as connection:
+      connection.execute("PRAGMA user_version = {}".format(_SCHEMA_VERSION))
+
+  def BulkAdd(self, samples: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Insert a batch of samples, as returned by Sample.FromProto(), in one transaction.
+
+    On SQLite the rows are inserted with a parameterized executemany() on the
+    raw DB-API connection, bypassing the ORM's per-row overhead.
+    """
+    if not samples:
+      return
+    if self.engine.dialect.name != "sqlite":
+      with self.Session(commit = True) as s:
+        s.bulk_insert_mappings(Sample, samples)
+      return
+    conn = self.engine.raw_connection()
+    try:
+      cursor = conn.cursor()
+      cursor.executemany(
+        _SAMPLE_INSERT_QUERY,
+        [tuple(sample[c] for c in _SAMPLE_COLUMNS) for sample in samples],
+      )
+      conn.commit()
+      # Refresh planner statistics, if the new rows made them stale.
+      cursor.execute("PRAGMA optimize")
+      cursor.close()
+    except Exception:
+      conn.rollback()
+      raise
+    finally:
+      conn.close()
+
+  def CreateIndexes(self) -> None:
+    """Create indexes of the samples table that older databases lack."""
+    with self.Session(commit = True) as s:
+      for index in Sample.__table__.indexes:
+        s.execute(
+          sql.text("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+            index.name, Sample.__tablename__, ", ".join(c.name for c in index.columns)
+          ))
+        )
+    return
+
+  def MigrateEncodedText(self) -> int:
+    """Convert rows that store encoded_text as a comma-separated string.
+
+    Older databases kept the encoded text as text. These rows are rewritten in
+    place to the np.int32 byte format.
+
+    Returns:
+      The number of rows migrated.
+    """
+    with self.Session(commit = True) as s:
+      rows = s.execute(
+        sql.text("SELECT id, encoded_text FROM samples WHERE typeof(encoded_text) = 'text'")
+      ).fetchall()
+      for id, encoded_text in rows:
+        s.execute(
+          sql.text("UPDATE samples SET encoded_text = :encoded_text WHERE id = :id"),
+          {"encoded_text": EncodedTextToBytes(encoded_text), "id": id},
+        )
+    return len(rows)
+
+  def MigrateDateAdded(self) -> int:
+    """Convert rows that store date_added as a DateTime string.
+
+    Older databases kept the date as ISO-8601 text. SQLite's julianday() parses
+    it, so rows are rewritten to epoch milliseconds with a single UPDATE.
+
+    Returns:
+      The number of rows migrated.
+    """
+    with self.Session(commit = True) as s:
+      result = s.execute(
+        sql.text(
+          "UPDATE samples "
+          "SET date_added = CAST(ROUND((julianday(date_added) - 2440587.5) * 86400000) AS INTEGER) "
+          "WHERE typeof(date_added) = 'text'"
+        )
+      )
+    return result.rowcount
 
   @property
   def count(self):
@@ -0,0 +1,62 @@
+"""Unit tests for deeplearning.clgen.samplers.samples_database."""
+import pathlib
+import sqlite3
+
+import numpy as np
+
+from deeplearning.clgen.samplers import samples_database
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+# A sample row with encoded_text in the old comma-separated text format.
+_INSERT_ROW = (
+  "INSERT INTO samples (id, sha256, train_step, original_input, sample_feed, "
+  "text, sample_indices, encoded_text, encoded_sample_indices, compile_status, "
+  "feature_vector, num_tokens, categorical_sampling, sample_time_ms, date_added) "
+  "VALUES (0, 'x', 0, '', '', 'a', '', '1,2,3', '', 1, '', 3, 0, 5, ?)"
+)
+
+def _Connect(path: pathlib.Path) -> sqlite3.Connection:
+  return sqlite3.connect(str(path))
+
+def _MakeVersion0Database(path: pathlib.Path) -> None:
+  """Create a database as written before encoded_text and date_added migrated."""
+  samples_database.SamplesDatabase("sqlite:///{}".format(path))
+  with _Connect(path) as connection:
+    for index in samples_database.Sample.__table__.indexes:
+      connection.execute("DROP INDEX IF EXISTS {}".format(index.name))
+    connection.execute(_INSERT_ROW, ("2021-01-02 03:04:05.000000",))
+    connection.execute("PRAGMA user_version = 0")
+
+def test_SamplesDatabase_migrates_version_0_database(tempdir: pathlib.Path):
+  """Test that text columns and missing indexes of an old database are migrated."""
+  path = tempdir / "samples.db"
+  _MakeVersion0Database(path)
+
+  db = samples_database.SamplesDatabase("sqlite:///{}".format(path))
+
+  with _Connect(path) as connection:
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == samples_database._SCHEMA_VERSION
+    indexes = {row[1] for row in connection.execute("PRAGMA index_list(samples)")}
+  assert {index.name for index in samples_database.Sample.__table__.indexes} <= indexes
+  with db.Session() as s:
+    sample = s.query(samples_database.Sample).one()
+    assert sample.encoded_text_array.tolist() == [1, 2, 3]
+    assert sample.encoded_text_array.dtype == np.int32
+    assert sample.date_added == 1609556645000
+
+def test_SamplesDatabase_skips_migrations_at_current_version(tempdir: pathlib.Path):
+  """Test that a database at the current version is not scanned again."""
+  path = tempdir / "samples.db"
+  samples_database.SamplesDatabase("sqlite:///{}".format(path))
+  with _Connect(path) as connection:
+    connection.execute(_INSERT_ROW, (0,))
+
+  samples_database.SamplesDatabase("sqlite:///{}".format(path))
+
+  with _Connect(path) as connection:
+    assert connection.execute("SELECT typeof(encoded_text) FROM samples").fetchone()[0] == "text"
+
+if __name__ == "__main__":
+  test.Main()
@@ -2,11 +2,47 @@
 In-house plotter module that plots data.
 Based on plotly module
 """
+import os
 import typing
 import pathlib
 import numpy as np
 from plotly import graph_objs as go
 
+def _AxesLayout(title: str, x_name: str, y_name: str) -> typing.Dict[str, typing.Any]:
+  """
+  Layout spec for a titled figure with named axes.
+  Kept as a plain dict, so that plotly validates it only once,
+  when the figure is constructed, instead of once for a go.Layout
+  and once more when that is copied into the figure.
+  """
+  return {
+    'title': title,
+    'xaxis': {'title': x_name},
+    'yaxis': {'title': y_name},
+  }
+
+def _AsTraceData(values: typing.Any) -> typing.Any:
+  """
+  Cast numeric trace data upfront to a contiguous float64 array,
+  which plotly serializes as a whole instead of element by element.
+  Non-numeric data, e.g. categorical keys, is returned untouched.
+  """
+  arr = np.asarray(values)
+  if arr.dtype.kind in 'iuf':
+    return np.ascontiguousarray(arr, dtype = np.float64)
+  return values
+
+def _WriteFigure(fig: go.Figure, plot_name: str, path: pathlib.Path) -> None:
+  """
+  Write figure as html and png.
+  Output paths share a string prefix, built once
+  instead of joining a new pathlib.Path per format.
+  """
+  prefix = os.fspath(path) + os.sep + plot_name + "."
+  fig.write_html (prefix + "html")
+  fig.write_image(prefix + "png", scale = 2.0)
+  return
+
 def SingleScatterLine(x: np.array,
                       y: np.array,
                       title : str,
@@ -16,12 +52,8 @@ def SingleScatterLine(x: np.array,
                       path: pathlib.Path,
                       ) -> None:
   """Plot a single line, with scatter points at datapoints."""
-  layout = go.Layout(
-    title = title,
-    xaxis = dict(title = x_name),
-    yaxis = dict(title = y_name),
-  )
-  fig = go.Figure(layout = layout)
+  x, y = _AsTraceData(x), _AsTraceData(y)
+  fig = go.Figure(layout = _AxesLayout(title, x_name, y_name))
   fig.add_trace(
     go.Scatter(
       x = x, y = y,
@@ -32,9 +64,7 @@ def SingleScatterLine(x: np.array,
       opacity = 0.75
     )
   )
-  outf = lambda ext: str(path / "{}.{}".format(plot_name, ext))
-  fig.write_html (outf("html"))
-  fig.write_image(outf("png"), scale = 2.0)
+  _WriteFigure(fig, plot_name, path)
   return
 
 def FrequencyBars(x: np.array,
@@ -45,12 +75,8 @@ def FrequencyBars(x: np.array,
                   path: pathlib.Path
                   ) -> None:
   """Plot frequency bars based on key."""
-  layout = go.Layout(
-    title = title,
-    xaxis = dict(title = x_name),
-    yaxis = dict(title = "# of Occurences"),
-  )
-  fig = go.Figure(layout = layout)
+  x, y = _AsTraceData(x), _AsTraceData(y)
+  fig = go.Figure(layout = _AxesLayout(title, x_name, "# of Occurences"))
   fig.add_trace(
     go.Bar(
       x = x,
@@ -60,9 +86,31 @@ def FrequencyBars(x: np.array,
       opacity = 0.75,
     )
   )
-  outf = lambda ext: str(path / "{}.{}".format(plot_name, ext))
-  fig.write_html (outf("html"))
-  fig.write_image(outf("png"), scale = 2.0)
+  _WriteFigure(fig, plot_name, path)
+  return
+
+def FrequencyBarsFromValues(values   : np.array,
+                            title    : str,
+                            x_name   : str,
+                            plot_name: str,
+                            path: pathlib.Path
+                            ) -> None:
+  """Count occurences of raw values and plot them as frequency bars."""
+  values = np.asarray(values)
+  if values.dtype.kind in 'iu' and (values.size == 0 or values.min() >= 0):
+    y = np.bincount(values)
+    x = np.nonzero(y)[0]
+    y = y[x]
+  else:
+    x, y = np.unique(values, return_counts = True)
+  FrequencyBars(
+    x = x,
+    y = y,
+    title     = title,
+    x_name    = x_name,
+    plot_name = plot_name,
+    path      = path,
+  )
   return
 
 def LogitsStepsDistrib(x              : typing.List[np.array],
@@ -123,9 +171,7 @@ def CumulativeHistogram(x: np.array,
       opacity = 0.65,
     )
   )
-  outf = lambda ext: str(path / "{}.{}".format(plot_name, ext))
-  fig.write_html (outf("html"))
-  fig.write_image(outf("png"), scale = 2.0)
+  _WriteFigure(fig, plot_name, path)
   return
 
 def NormalizedRadar(r         : np.array,
@@ -147,9 +193,7 @@ def NormalizedRadar(r         : np.array,
       marker_color = "#cbef0e",
     )
   )
-  outf = lambda ext: str(path / "{}.{}".format(plot_name, ext))
-  fig.write_html (outf("html"))
-  fig.write_image(outf("png"), scale = 2.0)
+  _WriteFigure(fig, plot_name, path)
   return
 
 def CategoricalViolin(x: np.array,
@@ -181,7 +225,5 @@ def CategoricalViolin(x: np.array,
         opacity = 0.65,
       )
     )
-  outf = lambda ext: str(path / "{}.{}".format(plot_name, ext))
-  fig.write_html (outf("html"))
-  fig.write_image(outf("png"), scale = 2.0)
+  _WriteFigure(fig, plot_name, path)
   return
\ No newline at end of file
@@ -32,6 +32,13 @@ flags.DEFINE_boolean(
   therefore eager execution must be disabled."
 )
 
+flags.DEFINE_boolean(
+  "tf_xla_jit",
+  True,
+  "Enable XLA auto-clustering, so that supported ops are JIT-compiled into fused kernels. \
+  Disable if the model uses ops that XLA cannot compile."
+)
+
 flags.DEFINE_string(
   "tf_device",
   "gpu",
@@ -79,4 +86,8 @@ def initTensorflow():
 
   if FLAGS.tf_disable_eager:
     tensorflow.compat.v1.disable_eager_execution()
+  if FLAGS.tf_xla_jit:
+    # TF_XLA_FLAGS covers graph-mode sessions, set_jit() the eager context.
+    os.environ.setdefault('TF_XLA_FLAGS', "--tf_xla_auto_jit=2 --tf_xla_cpu_global_jit")
+    tensorflow.config.optimizer.set_jit(True)
   tf = tensorflow
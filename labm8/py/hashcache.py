@@ -17,37 +17,50 @@ Checksums files and directories and cache results. If a file or directory has
 not been modified, subsequent hashes are cache hits. Hashes are recomputed
 lazily, when a directory (or any of its subdirectories) have been modified.
 """
+import collections
+import concurrent.futures
+import functools
+import hashlib
+import mmap
 import os
 import pathlib
-import subprocess
+import stat
+import sys
 import time
 import typing
 
-import checksumdir
 import sqlalchemy as sql
 from sqlalchemy.ext import declarative
 
 from labm8.py import app
-from labm8.py import crypto
-from labm8.py import fs
 from labm8.py import humanize
 from labm8.py import sqlutil
 
-FLAGS = app.FLAGS
-
-Base = declarative.declarative_base()
+try:
+  import blake3
+except ImportError:
+  blake3 = None
 
+FLAGS = app.FLAGS
 
-class InMemoryCacheKey(typing.NamedTuple):
-  """An in-memory cache which is optionally shared amongst all HashCache
-  instances. The in-memory cache omits timestamps from records.
-  """
+app.DEFINE_integer(
+  "hashcache_in_memory_size",
+  1 << 17,
+  "The maximum number of hashes kept in the in-memory cache of HashCache "
+  "instances with keep_in_memory set. Least recently used hashes are "
+  "evicted first.",
+)
 
-  hash_fn: str
-  path: str
+Base = declarative.declarative_base()
 
 
-IN_MEMORY_CACHE: typing.Dict[InMemoryCacheKey, str] = {}
+# An in-memory cache which is optionally shared amongst all HashCache
+# instances. The in-memory cache omits timestamps from records. Keys are plain
+# (hash_fn, path) tuples of interned strings, which are cheap to build, and
+# compare by identity on a hit.
+IN_MEMORY_CACHE: typing.OrderedDict[
+  typing.Tuple[str, str], bytes
+] = collections.OrderedDict()
 
 
 class HashCacheRecord(Base):
@@ -55,77 +68,272 @@ class HashCacheRecord(Base):
 
   __tablename__ = "entries"
 
+  # A 128-bit BLAKE2b fingerprint of the absolute path. Paths are only ever
+  # looked up by equality, so the fixed size key keeps the index compact.
+  path_hash: bytes = sql.Column(sql.LargeBinary(16), primary_key=True)
   # The absolute path to a file or directory.
-  absolute_path: str = sql.Column(sql.String(4096), primary_key=True)
-  # The number of seconds since the epoch that the file or directory was last
-  # modified.
-  last_modified: int = sql.Column(sql.Integer, nullable=False)
-  # The cached hash in hexadecimal encoding. We use the length of the longest
-  # supported hash function: sha256.
-  hash: str = sql.Column(sql.String(64), nullable=False)
+  absolute_path: str = sql.Column(sql.String(4096), nullable=False)
+  # The number of nanoseconds since the epoch that the file or directory was
+  # last modified.
+  last_modified: int = sql.Column(sql.BigInteger, nullable=False)
+  # The cached hash as a raw digest. We use the length of the longest
+  # supported hash functions: sha256 and blake3.
+  hash: bytes = sql.Column(sql.LargeBinary(32), nullable=False)
+
+
+# Statements for the hot path of HashCache. These skip the ORM, whose per-query
+# overhead is far higher than the cost of an SQLite primary key lookup.
+_LOOKUP_SQL = sql.text(
+  "SELECT hash FROM entries "
+  "WHERE path_hash = :path_hash AND last_modified = :last_modified"
+)
+_INSERT_SQL = sql.text(
+  "INSERT OR REPLACE INTO entries "
+  "(path_hash, absolute_path, last_modified, hash) "
+  "VALUES (:path_hash, :absolute_path, :last_modified, :hash)"
+)
+
+# The version of the entries table schema, stored in the SQLite user_version.
+# Bump this whenever HashCacheRecord changes.
+_SCHEMA_VERSION = 2
+
+
+def _PathHash(path: str) -> bytes:
+  """Return the fingerprint of an absolute path, used as the table key."""
+  return hashlib.blake2b(os.fsencode(path), digest_size=16).digest()
+
+
+class _PathBloomFilter(object):
+  """A bloom filter of the path fingerprints in the entries table.
+
+  A path that is not in the filter has no cache entry, so the database lookup
+  can be skipped. Path fingerprints are already uniformly distributed, so the
+  four bit indices of a path are slices of its fingerprint. False positives
+  only cost a lookup, so the filter is not resized as entries are added.
+  """
+
+  def __init__(self, num_bits: int):
+    self.num_bits = num_bits
+    self.bits = bytearray((num_bits + 7) // 8)
+
+  def _Indices(self, path_hash: bytes) -> typing.Iterator[int]:
+    for i in range(0, 16, 4):
+      yield int.from_bytes(path_hash[i : i + 4], "little") % self.num_bits
+
+  def Add(self, path_hash: bytes) -> None:
+    for index in self._Indices(path_hash):
+      self.bits[index >> 3] |= 1 << (index & 7)
+
+  def __contains__(self, path_hash: bytes) -> bool:
+    return all(
+      self.bits[index >> 3] & (1 << (index & 7))
+      for index in self._Indices(path_hash)
+    )
 
 
 def GetDirectoryMTime(path: pathlib.Path) -> int:
   """Get the timestamp of the most recently modified file/dir in directory.
 
   Recursively checks subdirectory contents. This requires that the directory
-  exists and is not empty.
+  exists.
 
   Params:
     abspath: The absolute path to the directory.
 
   Returns:
-    The seconds since epoch of the last modification.
+    The nanoseconds since epoch of the last modification, or 0 if the
+    directory contains no files.
+  """
+  return _WalkDirectory(path)[0]
+
+
+# A file of a directory walk: its path and, if the file has multiple hard
+# links, its (st_dev, st_ino) pair.
+_WalkedFile = typing.Tuple[str, typing.Optional[typing.Tuple[int, int]]]
+
+
+def _WalkDirectory(
+  path: pathlib.Path,
+) -> typing.Tuple[int, typing.List[_WalkedFile]]:
+  """Walk a directory tree once, for both its mtime and its hashed files.
+
+  Returns:
+    A tuple of the newest mtime of any regular file in the tree, as returned by
+    GetDirectoryMTime(), and the list of files which DirHash() digests.
+  """
+  # Walk the tree with an explicit stack of directories. os.scandir() yields
+  # entries with their file type, so only regular files need a stat() call,
+  # and no subprocesses are spawned. Files in hidden directories count towards
+  # the mtime, but are not hashed.
+  last_modified = 0
+  files = []
+  stack = [(os.fspath(path), False)]
+  while stack:
+    directory, hidden = stack.pop()
+    with os.scandir(directory) as it:
+      for entry in it:
+        entry_hidden = hidden or entry.name.startswith(".")
+        if entry.is_dir(follow_symlinks=False):
+          stack.append((entry.path, entry_hidden))
+          continue
+        inode = None
+        if entry.is_file(follow_symlinks=False):
+          st = entry.stat(follow_symlinks=False)
+          if st.st_mtime_ns > last_modified:
+            last_modified = st.st_mtime_ns
+          if st.st_nlink > 1:
+            inode = (st.st_dev, st.st_ino)
+        # Symlinks to files are hashed, symlinks to directories are not.
+        if not entry_hidden and not entry.is_dir():
+          files.append((entry.path, inode))
+  return last_modified, files
+
+
+# The size, in bytes, from which blake3 digests a file using multiple threads.
+# Below it, spawning threads costs more than it saves.
+_BLAKE3_MULTITHREADING_SIZE = 1 << 20
+
+
+def _NewHasher(hash_fn: str, size: int = 0):
+  """Return a new hash object for the named hash function.
+
+  Args:
+    hash_fn: The name of the hash function.
+    size: The number of bytes that will be hashed, if known. blake3 spreads
+      large inputs over all cores.
+  """
+  if hash_fn == "blake3":
+    if size >= _BLAKE3_MULTITHREADING_SIZE:
+      return blake3.blake3(max_threads=blake3.blake3.AUTO)
+    return blake3.blake3()
+  return hashlib.new(hash_fn)
+
+
+def _FileDigest(path: str, hash_fn: str) -> bytes:
+  """Hash a file.
+
+  The file is memory-mapped, so that it is digested in a single call into
+  hashlib. Files which cannot be mapped (empty, or larger than the address
+  space) are read in 64 KiB blocks.
+  """
+  with open(path, "rb") as f:
+    size = os.fstat(f.fileno()).st_size
+    hasher = _NewHasher(hash_fn, size)
+    if 0 < size < sys.maxsize:
+      with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        hasher.update(mm)
+    else:
+      for block in iter(functools.partial(f.read, 64 * 1024), b""):
+        hasher.update(block)
+  return hasher.digest()
+
+
+def DirHash(path: pathlib.Path, hash_fn: str) -> str:
+  """Compute the checksum of a directory's contents.
+
+  This produces the same checksum as checksumdir.dirhash(): every file in the
+  tree is hashed, and the sorted hexadecimal file digests are hashed together.
+  Hidden files and directories are skipped, and symlinks to directories are
+  not followed. Files are hashed concurrently, as hashlib releases the GIL
+  while digesting.
+
+  Args:
+    path: The path to the directory.
+    hash_fn: The name of the hash function. One of: md5, sha1, sha256,
+      blake3.
+
+  Returns:
+    Hexadecimal string hash.
+  """
+  return _FilesDigest(_WalkDirectory(path)[1], hash_fn).hex()
+
+
+def _FilesDigest(files: typing.List[_WalkedFile], hash_fn: str) -> bytes:
+  """Compute the raw digest of DirHash() from the files of a directory.
+
+  Hard links to the same inode are read only once.
   """
-  # Pure python implementation.
-  # return int(max(
-  #     max(os.path.getmtime(os.path.join(root, file)) for file in files) for
-  #     root, _, files in os.walk(path)))
-  # Faster implementation using UNIX tools. Requires GNU tools. On macOS, this
-  # means having some homebrew package installed:
-  #
-  #    $ brew install findutils coreutils
-  #
-  # and the following directory in your PATH:
-  #    /usr/local/opt/findutils/libexec/gnubin
-  #    /usr/local/opt/coreutils/libexec/gnubin
-  output = subprocess.check_output(
-    f"find '{path}' -type f | xargs -d'\n' stat -c '%Y:%n' | sort -t: -n | "
-    "tail -1 | cut -d: -f1",
-    universal_newlines=True,
-    shell=True,
-  )
-  return int(output)
+  unique_files = {}
+  for path, inode in files:
+    unique_files.setdefault(inode or path, path)
+  with concurrent.futures.ThreadPoolExecutor(os.cpu_count()) as executor:
+    digests = dict(
+      zip(
+        unique_files.keys(),
+        executor.map(
+          functools.partial(_FileDigest, hash_fn=hash_fn),
+          unique_files.values(),
+        ),
+      )
+    )
+  file_digests = [digests[inode or path] for path, inode in files]
+  # Raw digests sort in the same order as their hexadecimal encodings.
+  hasher = _NewHasher(hash_fn)
+  for digest in sorted(file_digests):
+    hasher.update(digest.hex().encode("utf-8"))
+  return hasher.digest()
 
 
 class HashCache(sqlutil.Database):
   def __init__(
-    self, path: pathlib.Path, hash_fn: str, keep_in_memory: bool = False,
+    self,
+    path: pathlib.Path,
+    hash_fn: str,
+    keep_in_memory: bool = False,
+    in_memory_size: typing.Optional[int] = None,
   ):
     """Instantiate a hash cache.
 
     Args:
       path:
-      hash_fn: The name of the hash function. One of: md5, sha1, sha256.
+      hash_fn: The name of the hash function. One of: md5, sha1, sha256,
+        blake3. blake3 requires the blake3 package, and is considerably faster
+        than the others.
       keep_in_memory: If True, hashes are kept in memory for the lifespan
         of the process, or until Clear() is called on any HashCache instance.
         Use this with caution, as the in-memory cache does not invalidate
         entries, so cache entries can become stale.
+      in_memory_size: The maximum number of hashes in the in-memory cache. If
+        not set, --hashcache_in_memory_size is used, or its default value if
+        flags have not been parsed.
 
     Raises:
-      ValueError: If hash_fn not recognized.
+      ValueError: If hash_fn not recognized, or it is blake3 and the blake3
+        package is not installed.
     """
     super(HashCache, self).__init__(f"sqlite:///{path.absolute()}", Base)
-    self.hash_fn_name = hash_fn
-    if hash_fn == "md5":
-      self.hash_fn_file = crypto.md5_file
-    elif hash_fn == "sha1":
-      self.hash_fn_file = crypto.sha1_file
-    elif hash_fn == "sha256":
-      self.hash_fn_file = crypto.sha256_file
-    else:
+    # Every entry of a hash cache can be recomputed, so relax durability in
+    # favour of write throughput.
+    sqlutil.SetSqlitePragmasOnConnect(
+      self.engine,
+      [
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        "temp_store=MEMORY",
+        "mmap_size=268435456",
+        "cache_size=-65536",
+      ],
+    )
+    self._MigrateSchema()
+    self._LoadBloomFilter()
+    self.hash_fn_name = sys.intern(hash_fn)
+    if hash_fn not in {"md5", "sha1", "sha256", "blake3"}:
       raise ValueError(f"Hash function not recognized: '{hash_fn}'")
+    if hash_fn == "blake3" and blake3 is None:
+      raise ValueError("Hash function 'blake3' requires the blake3 package")
+    self.hash_fn_file = functools.partial(_FileDigest, hash_fn=hash_fn)
     self.keep_in_memory = keep_in_memory
+    if in_memory_size is None:
+      if FLAGS.is_parsed():
+        in_memory_size = FLAGS.hashcache_in_memory_size
+      else:
+        in_memory_size = FLAGS["hashcache_in_memory_size"].default
+    self.in_memory_size = in_memory_size
+    # Pick the lookup once, rather than checking keep_in_memory per path.
+    if keep_in_memory:
+      self._InMemoryWrapper = self._InMemoryHash
+    else:
+      self._InMemoryWrapper = self._PersistentHash
 
   def GetHash(self, path: pathlib.Path) -> str:
     """Get the hash of a file or directory.
@@ -136,8 +344,9 @@ class HashCache(sqlutil.Database):
     mtime of every file.
 
     Note that the a file's mtime is used to determine cache hits. This uses
-    second granularity, so if a file has been modified within a second, this
-    method will erroneously return the cached checksum of the previous version.
+    the nanosecond timestamps of the filesystem, so a file modified within the
+    timestamp granularity of the filesystem may still return the cached
+    checksum of the previous version.
 
     Args:
       path: Path to the file or directory.
@@ -148,10 +357,78 @@ class HashCache(sqlutil.Database):
     Raises:
       FileNotFoundError: If the requested path does not exist.
     """
-    if path.is_file():
-      return self._HashFile(path)
-    elif path.is_dir():
-      return self._HashDirectory(path)
+    return self.GetHashes([path])[0]
+
+  def GetHashes(self, paths: typing.Iterable[pathlib.Path]) -> typing.List[str]:
+    """Get the hashes of a list of files or directories.
+
+    This is equivalent to calling GetHash() on every path, except that all
+    lookups share one session, and new cache entries are written to the
+    database in a single transaction.
+
+    Args:
+      paths: Paths to the files or directories.
+
+    Returns:
+      A list of hexadecimal string hashes, in the same order as paths.
+
+    Raises:
+      FileNotFoundError: If a requested path does not exist.
+    """
+    new_entries = []
+    with self.Session(commit=True) as session:
+      hashes = [self._GetHash(session, path, new_entries) for path in paths]
+      if new_entries:
+        # Replacing in place also drops any stale entry for the same path.
+        session.execute(_INSERT_SQL, new_entries)
+    for entry in new_entries:
+      self._bloom_filter.Add(entry["path_hash"])
+    return [hash_.hex() for hash_ in hashes]
+
+  def _MigrateSchema(self) -> None:
+    """Recreate the entries table if it was created with an older schema.
+
+    Every cache entry can be recomputed, so outdated tables are emptied rather
+    than converted.
+    """
+    with self.engine.connect() as connection:
+      version = connection.execute("PRAGMA user_version").scalar()
+      if version != _SCHEMA_VERSION:
+        HashCacheRecord.__table__.drop(connection, checkfirst=True)
+        HashCacheRecord.__table__.create(connection)
+        connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        app.Log(2, "Migrated hash cache schema to version %d", _SCHEMA_VERSION)
+
+  def _LoadBloomFilter(self) -> None:
+    """Build the bloom filter of the paths with a persistent cache entry.
+
+    The filter is sized for a false positive rate of about 2% at twice the
+    current number of entries.
+    """
+    with self.engine.connect() as connection:
+      path_hashes = [
+        row[0] for row in connection.execute("SELECT path_hash FROM entries")
+      ]
+    self._bloom_filter = _PathBloomFilter(max(1 << 20, 16 * len(path_hashes)))
+    for path_hash in path_hashes:
+      self._bloom_filter.Add(path_hash)
+
+  def _GetHash(
+    self,
+    session: sqlutil.Session,
+    path: pathlib.Path,
+    new_entries: typing.List[typing.Dict[str, typing.Any]],
+  ) -> bytes:
+    # A single stat() both classifies the path and, for files, provides the
+    # mtime.
+    try:
+      st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+      raise FileNotFoundError(f"File not found: '{path}'")
+    if stat.S_ISREG(st.st_mode):
+      return self._HashFile(session, str(path), st, new_entries)
+    elif stat.S_ISDIR(st.st_mode):
+      return self._HashDirectory(session, str(path), new_entries)
     else:
       raise FileNotFoundError(f"File not found: '{path}'")
 
@@ -165,76 +442,126 @@ class HashCache(sqlutil.Database):
     IN_MEMORY_CACHE.clear()
     with self.Session(commit=True) as session:
       session.query(HashCacheRecord).delete()
+    self._bloom_filter = _PathBloomFilter(self._bloom_filter.num_bits)
     app.Log(2, "Emptied cache")
 
-  def _HashDirectory(self, absolute_path: pathlib.Path) -> str:
-    if fs.directory_is_empty(absolute_path):
-      last_modified_fn = lambda path: int(time.time())
-    else:
-      last_modified_fn = lambda path: GetDirectoryMTime(path)
+  def _HashDirectory(
+    self,
+    session: sqlutil.Session,
+    absolute_path: str,
+    new_entries: typing.List[typing.Dict[str, typing.Any]],
+  ) -> bytes:
+    # The directory is walked only once. The walk that finds the newest mtime
+    # also lists the files to hash, in case the cache entry is stale. An empty
+    # directory has an mtime of 0, so it is cached like any other directory,
+    # and adding a file to it invalidates the entry.
+    files = []
+
+    def LastModified(path: str) -> int:
+      last_modified, walked_files = _WalkDirectory(path)
+      files.extend(walked_files)
+      return last_modified
+
     return self._InMemoryWrapper(
+      session,
       absolute_path,
-      last_modified_fn,
-      lambda x: checksumdir.dirhash(x, self.hash_fn_name),
+      LastModified,
+      lambda x: _FilesDigest(files, self.hash_fn_name),
+      new_entries,
     )
 
-  def _HashFile(self, absolute_path: pathlib.Path) -> str:
+  def _HashFile(
+    self,
+    session: sqlutil.Session,
+    absolute_path: str,
+    st: os.stat_result,
+    new_entries: typing.List[typing.Dict[str, typing.Any]],
+  ) -> bytes:
     return self._InMemoryWrapper(
+      session,
       absolute_path,
-      lambda path: int(os.path.getmtime(path)),
+      lambda path: st.st_mtime_ns,
       self.hash_fn_file,
+      new_entries,
     )
 
-  def _InMemoryWrapper(
+  def _InMemoryHash(
     self,
-    absolute_path: pathlib.Path,
-    last_modified_fn: typing.Callable[[pathlib.Path], int],
-    hash_fn: typing.Callable[[pathlib.Path], str],
-  ) -> str:
+    session: sqlutil.Session,
+    absolute_path: str,
+    last_modified_fn: typing.Callable[[str], int],
+    hash_fn: typing.Callable[[str], bytes],
+    new_entries: typing.List[typing.Dict[str, typing.Any]],
+  ) -> bytes:
     """A wrapper around the persistent hashing to support in-memory cache."""
-    if self.keep_in_memory:
-      in_memory_key = InMemoryCacheKey(self.hash_fn_name, absolute_path)
-      if in_memory_key in IN_MEMORY_CACHE:
-        app.Log(2, "In-memory cache hit: '%s'", absolute_path)
-        return IN_MEMORY_CACHE[in_memory_key]
-    hash_ = self._DoHash(
-      absolute_path, last_modified_fn(absolute_path), hash_fn,
+    in_memory_key = (self.hash_fn_name, sys.intern(absolute_path))
+    hash_ = IN_MEMORY_CACHE.get(in_memory_key)
+    if hash_ is not None:
+      app.Log(2, "In-memory cache hit: '%s'", absolute_path)
+      IN_MEMORY_CACHE.move_to_end(in_memory_key)
+      return hash_
+    hash_ = self._PersistentHash(
+      session, absolute_path, last_modified_fn, hash_fn, new_entries,
     )
-    if self.keep_in_memory:
-      IN_MEMORY_CACHE[in_memory_key] = hash_
+    IN_MEMORY_CACHE[in_memory_key] = hash_
+    if len(IN_MEMORY_CACHE) > self.in_memory_size:
+      IN_MEMORY_CACHE.popitem(last=False)
     return hash_
 
+  def _PersistentHash(
+    self,
+    session: sqlutil.Session,
+    absolute_path: str,
+    last_modified_fn: typing.Callable[[str], int],
+    hash_fn: typing.Callable[[str], bytes],
+    new_entries: typing.List[typing.Dict[str, typing.Any]],
+  ) -> bytes:
+    """Hash a path using only the persistent cache."""
+    return self._DoHash(
+      session,
+      absolute_path,
+      last_modified_fn(absolute_path),
+      hash_fn,
+      new_entries,
+    )
+
   def _DoHash(
     self,
-    absolute_path: pathlib.Path,
+    session: sqlutil.Session,
+    absolute_path: str,
     last_modified: int,
-    hash_fn: typing.Callable[[pathlib.Path], str],
-  ) -> str:
-    with self.Session() as session:
-      cached_entry = (
-        session.query(HashCacheRecord)
-        .filter(HashCacheRecord.absolute_path == str(absolute_path),)
-        .first()
-      )
-      if cached_entry and cached_entry.last_modified == last_modified:
+    hash_fn: typing.Callable[[str], bytes],
+    new_entries: typing.List[typing.Dict[str, typing.Any]],
+  ) -> bytes:
+    """Look up a path in the persistent cache, hashing it on a miss.
+
+    New entries are appended to new_entries, for the caller to write.
+    """
+    path_hash = _PathHash(absolute_path)
+    # A stale entry does not match the mtime, so it is a miss like a missing
+    # entry, and is replaced when the new entries are written.
+    if path_hash in self._bloom_filter:
+      cached_hash = session.execute(
+        _LOOKUP_SQL, {"path_hash": path_hash, "last_modified": last_modified}
+      ).scalar()
+      if cached_hash is not None:
         app.Log(2, "Cache hit: '%s'", absolute_path)
-        return cached_entry.hash
-      elif cached_entry:
-        app.Log(2, "Cache miss: '%s'", absolute_path)
-        session.delete(cached_entry)
-      start_time = time.time()
-      checksum = hash_fn(absolute_path)
-      app.Log(
-        2,
-        "New cache entry '%s' in %s ms.",
-        absolute_path,
-        humanize.Commas(int((time.time() - start_time) * 1000)),
-      )
-      new_entry = HashCacheRecord(
-        absolute_path=str(absolute_path),
-        last_modified=last_modified,
-        hash=checksum,
-      )
-      session.add(new_entry)
-      session.commit()
-      return new_entry.hash
+        return cached_hash
+    app.Log(2, "Cache miss: '%s'", absolute_path)
+    start_time = time.time()
+    checksum = hash_fn(absolute_path)
+    app.Log(
+      2,
+      "New cache entry '%s' in %s ms.",
+      absolute_path,
+      humanize.Commas(int((time.time() - start_time) * 1000)),
+    )
+    new_entries.append(
+      {
+        "path_hash": path_hash,
+        "absolute_path": absolute_path,
+        "last_modified": last_modified,
+        "hash": checksum,
+      }
+    )
+    return checksum
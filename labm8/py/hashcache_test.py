@@ -0,0 +1,98 @@
+# Copyright 2014-2020 Chris Cummins <chrisc.101@gmail.com>.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Unit tests for //labm8/py:hashcache."""
+import hashlib
+import pathlib
+import sqlite3
+
+from labm8.py import hashcache
+from labm8.py import test
+
+FLAGS = test.FLAGS
+
+
+def _UserVersion(path: pathlib.Path) -> int:
+  with sqlite3.connect(str(path)) as connection:
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _EntryCount(path: pathlib.Path) -> int:
+  with sqlite3.connect(str(path)) as connection:
+    return connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def test_HashCache_GetHash_file(tempdir: pathlib.Path):
+  """Test that the hash of a file matches hashlib."""
+  (tempdir / "a").write_text("hello")
+  c = hashcache.HashCache(tempdir / "hashcache.db", "sha256")
+  assert c.GetHash(tempdir / "a") == hashlib.sha256(b"hello").hexdigest()
+
+
+def test_HashCache_migrates_version_0_database(tempdir: pathlib.Path):
+  """Test that an entries table from before versioning is recreated."""
+  db_path = tempdir / "hashcache.db"
+  with sqlite3.connect(str(db_path)) as connection:
+    connection.execute(
+      "CREATE TABLE entries (absolute_path VARCHAR(4096) PRIMARY KEY, "
+      "last_modified INTEGER NOT NULL, hash VARCHAR(64) NOT NULL)"
+    )
+    connection.execute(
+      "INSERT INTO entries VALUES ('/stale', 0, 'd41d8cd98f00b204e9800998')"
+    )
+  assert _UserVersion(db_path) == 0
+
+  (tempdir / "a").write_text("hello")
+  c = hashcache.HashCache(db_path, "sha256")
+
+  assert _UserVersion(db_path) == hashcache._SCHEMA_VERSION
+  assert _EntryCount(db_path) == 0
+  assert c.GetHash(tempdir / "a") == hashlib.sha256(b"hello").hexdigest()
+  assert _EntryCount(db_path) == 1
+
+
+def test_HashCache_keeps_entries_of_current_version(tempdir: pathlib.Path):
+  """Test that reopening a cache at the current version keeps its entries."""
+  db_path = tempdir / "hashcache.db"
+  (tempdir / "a").write_text("hello")
+  hashcache.HashCache(db_path, "sha256").GetHash(tempdir / "a")
+  assert _EntryCount(db_path) == 1
+
+  c = hashcache.HashCache(db_path, "sha256")
+
+  assert _EntryCount(db_path) == 1
+  assert c.GetHash(tempdir / "a") == hashlib.sha256(b"hello").hexdigest()
+
+
+def test_HashCache_in_memory_size_evicts_least_recently_used(
+  tempdir: pathlib.Path,
+):
+  """Test that the in-memory cache is bounded by in_memory_size."""
+  hashcache.IN_MEMORY_CACHE.clear()
+  for name in "abc":
+    (tempdir / name).write_text(name)
+  c = hashcache.HashCache(
+    tempdir / "hashcache.db", "sha256", keep_in_memory=True, in_memory_size=2,
+  )
+
+  c.GetHashes([tempdir / "a", tempdir / "b", tempdir / "c"])
+
+  assert len(hashcache.IN_MEMORY_CACHE) == 2
+  assert ("sha256", str((tempdir / "a").absolute())) not in (
+    hashcache.IN_MEMORY_CACHE
+  )
+  hashcache.IN_MEMORY_CACHE.clear()
+
+
+if __name__ == "__main__":
+  test.Main()
@@ -338,6 +338,28 @@ def EnableSqliteForeignKeysCallback(dbapi_connection, connection_record):
     cursor.close()
 
 
+def SetSqlitePragmasOnConnect(engine: sql.engine.Engine, pragmas: List[str]):
+  """Run a list of pragmas on every new SQLite connection of an engine.
+
+  Args:
+    engine: The engine to register the listener on.
+    pragmas: Pragma statements without the "PRAGMA " prefix, for example
+      "journal_mode=WAL".
+  """
+
+  def _SetPragmasCallback(dbapi_connection, connection_record):
+    del connection_record
+    if isinstance(dbapi_connection, sqlite3.Connection):
+      cursor = dbapi_connection.cursor()
+      for pragma in pragmas:
+        cursor.execute(f"PRAGMA {pragma}")
+      cursor.close()
+
+  sql.event.listen(engine, "connect", _SetPragmasCallback)
+  # Drop connections opened before the listener was registered.
+  engine.dispose()
+
+
 def ResolveUrl(url: str, use_flags: bool = True):
   """Resolve the URL of a database.
 